@@ -3,6 +3,7 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import os
 import uuid
+import asyncio
 from typing import Optional, List, Dict, Any, Union
 import aiofiles
 from app.models.compliance import analyze_document
@@ -327,8 +328,10 @@ async def process_document(content: str, file_path: Optional[str], document_id:
         # Log processing start
         logger.info(f"Starting document processing for document_id: {document_id}")
         
-        # Analyze document for compliance
-        analysis_result = analyze_document(content)
+        # Analyze document for compliance; the analysis makes blocking OpenAI
+        # and web search calls, so run it in a worker thread to keep the event
+        # loop free for other requests
+        analysis_result = await asyncio.to_thread(analyze_document, content)
         
         # Store results in database
         await store_analysis_result(
@@ -33,4 +33,6 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # Auto-reload only in development
+    is_production = os.getenv("ENVIRONMENT", "development").lower() == "production"
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=not is_production) 
\ No newline at end of file
@@ -5,6 +5,7 @@ from various sources including public databases, APIs, and websites.
 """
 
 from typing import List, Dict, Any, Optional, Union
+import asyncio
 import os
 import json
 import requests
@@ -588,4 +589,20 @@ def search_with_agents(text: str, threshold: float = 0.3) -> List[Dict[str, Any]
         print(f"Error type: {type(e)}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
-        return [] 
\ No newline at end of file
+        return []
+
+async def asearch_with_agents(text: str, threshold: float = 0.3) -> List[Dict[str, Any]]:
+    """
+    Async wrapper around search_with_agents.
+    
+    The agent search is blocking, so it runs in a worker thread to let
+    several searches proceed concurrently from one event loop.
+    
+    Args:
+        text: The text to search for relevant regulatory sources
+        threshold: Minimum relevance score to include a source
+        
+    Returns:
+        List of relevant regulatory sources with relevance scores
+    """
+    return await asyncio.to_thread(search_with_agents, text, threshold)
@@ -4,6 +4,7 @@ import mimetypes
 from typing import List, Set, Dict, Any, Tuple, Optional
 import importlib.util
 import chardet
+import codecs
 import io
 import logging
 
@@ -23,6 +24,12 @@ BINARY_MIME_TYPES: Set[str] = {
     'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
 }
 
+# Bytes that occur in text files; any other byte marks content as binary
+TEXT_CHARS: bytes = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+
+# UTF-16 text legitimately contains NUL bytes, so BOM-prefixed data skips the byte scan
+UTF16_BOMS: Tuple[bytes, ...] = (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
 # Maximum file size (10 MB)
 MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10 MB in bytes
 
@@ -89,6 +96,11 @@ def detect_file_type(file_path: str) -> Dict[str, Any]:
         try:
             with open(file_path, 'rb') as f:
                 raw_data = f.read(4096)  # Read first 4KB to detect encoding
+                
+            # Control bytes outside TEXT_CHARS mean binary content; no need to run chardet
+            if not raw_data.startswith(UTF16_BOMS) and raw_data.translate(None, TEXT_CHARS):
+                is_binary = True
+            else:
                 result = chardet.detect(raw_data)
                 encoding = result['encoding'] or 'utf-8'
                 confidence = result['confidence']
@@ -5,17 +5,104 @@ Provides utilities for managing OpenAI API interactions, including Assistants AP
 
 import os
 import time
-from datetime import datetime, timedelta
+import random
+import logging
+import functools
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone, time as dt_time
+from email.utils import parsedate_to_datetime
 from typing import Dict, Any, List, Optional, Tuple
-from tenacity import retry, stop_after_attempt, wait_exponential
 import openai
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import json
 from dotenv import load_dotenv
 
+# Redis is optional; without it the token budget is tracked in memory
+try:
+    import redis
+except ImportError:
+    redis = None
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Instructions shared by the chat-completion and Assistants compliance paths
+COMPLIANCE_SYSTEM_PROMPT = (
+    "You are a regulatory compliance expert. "
+    "Analyze documents and provide compliance assessments. "
+    "Be thorough in your analysis and cite specific regulations when relevant."
+)
+
+# Approximate tokens the chat format adds per message (role and delimiters)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Seconds an idle compliance session keeps its Assistants thread
+THREAD_CACHE_TTL = 60 * 60
+
+# Retry settings for OpenAI API calls
+MAX_RETRY_ATTEMPTS = 5
+MAX_RETRY_DELAY = 60.0
+
+# Errors worth retrying; anything else (bad request, auth, quota) fails fast
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def _parse_retry_after(error: Exception) -> Optional[float]:
+    """
+    Read the Retry-After header from an OpenAI error response.
+    
+    Args:
+        error: Exception raised by the OpenAI client
+        
+    Returns:
+        Optional[float]: Seconds to wait, or None if the header is absent or unparseable
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    
+    # Delay in seconds
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    # HTTP-date
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+@functools.lru_cache(maxsize=128)
+def _format_reg_header(regulations: Tuple[str, ...]) -> str:
+    """Join a regulation list for the compliance prompt, cached per distinct set"""
+    return ", ".join(regulations)
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After, else jittered exponential backoff"""
+    retry_after = _parse_retry_after(error)
+    if retry_after is not None:
+        return min(retry_after, MAX_RETRY_DELAY)
+    return min(2 ** attempt + random.random(), MAX_RETRY_DELAY)
+
+
 class OpenAIManager:
     """Manager class for OpenAI API interactions"""
     
@@ -41,8 +128,9 @@ class OpenAIManager:
                 "40 characters long. Please check your API key."
             )
             
-        # Initialize OpenAI client
+        # Initialize OpenAI clients (async client is used from the event loop)
         self.client = OpenAI(api_key=self.api_key)
+        self.aclient = AsyncOpenAI(api_key=self.api_key)
         
         # Initialize token budget
         self.max_daily_tokens = max_daily_tokens or int(os.getenv('OPENAI_MAX_TOKENS', '100000'))
@@ -58,7 +146,11 @@ class OpenAIManager:
         # Create regulatory compliance assistant
         self.compliance_assistant = self._create_compliance_assistant()
         
-        print(f"OpenAI Manager initialized successfully with model: {self.default_model}")
+        # Assistants thread per compliance session: session_id -> (thread_id, last used)
+        self._thread_cache: Dict[str, Tuple[str, float]] = {}
+        self._thread_cache_lock = threading.Lock()
+        
+        logger.info(f"OpenAI Manager initialized successfully with model: {self.default_model}")
     
     def _validate_api_key(self, api_key: str) -> bool:
         """
@@ -84,9 +176,7 @@ class OpenAIManager:
             # Create a new assistant for regulatory compliance
             assistant = self.client.beta.assistants.create(
                 name="Regulatory Compliance Assistant",
-                instructions="""You are a regulatory compliance expert. 
-                Analyze documents and provide compliance assessments.
-                Be thorough in your analysis and cite specific regulations when relevant.""",
+                instructions=COMPLIANCE_SYSTEM_PROMPT,
                 model="gpt-4",
                 tools=[
                     {"type": "code_interpreter"},
@@ -108,16 +198,18 @@ class OpenAIManager:
             )
             return assistant
         except Exception as e:
-            print(f"Error creating assistant: {str(e)}")
+            logger.error(f"Error creating assistant: {str(e)}")
             return None
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def call_openai_with_retry(self, messages: List[Dict[str, str]], 
                              max_tokens: int = 1000,
                              temperature: float = 0.3) -> Any:
         """
         Make an OpenAI API call with retry logic.
         
+        Rate limits and transient errors are retried up to MAX_RETRY_ATTEMPTS
+        times, waiting for the server's Retry-After when it sends one.
+        
         Args:
             messages: List of message dictionaries
             max_tokens: Maximum tokens to generate
@@ -126,95 +218,243 @@ class OpenAIManager:
         Returns:
             OpenAI API response
         """
+        for attempt in range(MAX_RETRY_ATTEMPTS):
+            try:
+                return self._call_openai(messages, max_tokens, temperature)
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRY_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"{type(e).__name__} from OpenAI, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+    
+    async def acall_openai_with_retry(self, messages: List[Dict[str, str]],
+                                      max_tokens: int = 1000,
+                                      temperature: float = 0.3) -> Any:
+        """
+        Async variant of call_openai_with_retry for use inside the event loop.
+        
+        Args:
+            messages: List of message dictionaries
+            max_tokens: Maximum tokens to generate
+            temperature: Temperature for response generation
+            
+        Returns:
+            OpenAI API response
+        """
+        for attempt in range(MAX_RETRY_ATTEMPTS):
+            try:
+                return await self._acall_openai(messages, max_tokens, temperature)
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_RETRY_ATTEMPTS - 1:
+                    raise
+                delay = _retry_delay(e, attempt)
+                logger.warning(f"{type(e).__name__} from OpenAI, retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+    
+    def _call_openai(self, messages: List[Dict[str, str]],
+                     max_tokens: int,
+                     temperature: float) -> Any:
+        """Make a single OpenAI API call"""
         try:
-            # Estimate tokens
-            estimated_tokens = self._estimate_tokens(str(messages))
+            estimated_tokens, model = self._prepare_call(messages)
             
-            # Check token budget
-            if not self.token_budget.can_use_tokens(estimated_tokens):
-                raise Exception("Daily token budget exceeded")
+            # Make API call
+            try:
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=30
+                )
+            except Exception:
+                # The request failed, so give back the tokens reserved for it
+                self.token_budget.add_used_tokens(-estimated_tokens)
+                raise
             
-            # Get appropriate model
-            model = self._get_appropriate_model(estimated_tokens)
+            self._record_usage(response, estimated_tokens)
+            return response
             
-            # Make API call
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                timeout=30
-            )
+        except openai.APIError as e:
+            if "insufficient_quota" in str(e):
+                raise QuotaExceededError("OpenAI API quota exceeded") from e
+            raise
+    
+    async def _acall_openai(self, messages: List[Dict[str, str]],
+                            max_tokens: int,
+                            temperature: float) -> Any:
+        """Make a single async OpenAI API call"""
+        try:
+            # Budget reads and writes go through the async TokenBudget methods so
+            # Redis round-trips never run on the event loop
+            estimated_tokens, model = self._estimate_call(messages)
+            if not await self.token_budget.acquire(estimated_tokens):
+                raise Exception("Daily token budget exceeded")
             
-            # Update token budget
-            self.token_budget.add_used_tokens(
-                response.usage.total_tokens if hasattr(response, 'usage') else estimated_tokens
-            )
+            try:
+                response = await self.aclient.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    timeout=30
+                )
+            except Exception:
+                # The request failed, so give back the tokens reserved for it
+                await self.token_budget.aadd_used_tokens(-estimated_tokens)
+                raise
             
+            usage_delta = self._usage_delta(response, estimated_tokens)
+            if usage_delta:
+                await self.token_budget.aadd_used_tokens(usage_delta)
             return response
             
-        except openai.RateLimitError:
-            print("Rate limit reached, waiting...")
-            time.sleep(20)
-            raise
         except openai.APIError as e:
             if "insufficient_quota" in str(e):
                 raise QuotaExceededError("OpenAI API quota exceeded") from e
             raise
     
-    def analyze_compliance(self, text: str, regulations: List[str]) -> Dict[str, Any]:
+    def _prepare_call(self, messages: List[Dict[str, str]]) -> Tuple[int, str]:
         """
-        Analyze text for regulatory compliance using the Assistants API.
+        Estimate tokens for a request, pick a model and reserve the tokens.
+        
+        The estimate is reserved from the budget up front, so concurrent calls
+        cannot all pass the check and then overspend; _record_usage settles the
+        reservation once the actual usage is known.
+        
+        Returns:
+            Tuple[int, str]: (estimated tokens, model name)
+        """
+        estimated_tokens, model = self._estimate_call(messages)
+        
+        # Reserve from the token budget
+        if not self.token_budget.try_acquire(estimated_tokens):
+            raise Exception("Daily token budget exceeded")
+        
+        return estimated_tokens, model
+    
+    def _estimate_call(self, messages: List[Dict[str, str]]) -> Tuple[int, str]:
+        """
+        Estimate tokens for a request and pick a model, without touching the budget.
+        
+        Returns:
+            Tuple[int, str]: (estimated tokens, model name)
+        """
+        # Estimate tokens from message contents, plus per-message role/formatting overhead
+        estimated_tokens = sum(
+            self._estimate_tokens(message.get("content") or "") for message in messages
+        ) + MESSAGE_TOKEN_OVERHEAD * len(messages)
+        
+        # Get appropriate model
+        model = self._get_appropriate_model(estimated_tokens)
+        return estimated_tokens, model
+    
+    def _usage_delta(self, response: Any, estimated_tokens: int) -> int:
+        """Difference between the tokens a response used and the estimate reserved for it"""
+        used_tokens = response.usage.total_tokens if hasattr(response, 'usage') else estimated_tokens
+        return used_tokens - estimated_tokens
+    
+    def _record_usage(self, response: Any, estimated_tokens: int):
+        """Settle the tokens reserved in _prepare_call against the actual usage"""
+        usage_delta = self._usage_delta(response, estimated_tokens)
+        if usage_delta:
+            self.token_budget.add_used_tokens(usage_delta)
+    
+    def analyze_compliance(self, text: str, regulations: List[str],
+                           use_assistants: bool = False,
+                           session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze text for regulatory compliance.
+        
+        By default this is a single chat completion. Set use_assistants to run
+        the analysis through the Assistants API instead, for callers that need
+        the assistant's tools.
         
         Args:
             text: Text to analyze
             regulations: List of relevant regulations
+            use_assistants: Run the analysis on an Assistants API thread
+            session_id: Optional session key (e.g. a document ID). Assistants calls
+                with the same session reuse one thread and its conversation context
             
         Returns:
             Analysis results
         """
+        if use_assistants:
+            return self._analyze_compliance_with_assistant(text, regulations, session_id)
+        
         try:
-            # Create a new thread
-            thread = self.client.beta.threads.create()
+            response = self.call_openai_with_retry(
+                messages=[
+                    {"role": "system", "content": COMPLIANCE_SYSTEM_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"""Please analyze this text for compliance with the following regulations:
+                {_format_reg_header(tuple(regulations))}
+                
+                Text to analyze:
+                {text}"""
+                    }
+                ],
+                max_tokens=2000,
+                temperature=0.2
+            )
+            
+            return {
+                "status": "success",
+                "analysis": response.choices[0].message.content
+            }
+            
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e)
+            }
+    
+    def _analyze_compliance_with_assistant(self, text: str, regulations: List[str],
+                                           session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze text for regulatory compliance using the Assistants API.
+        
+        Args:
+            text: Text to analyze
+            regulations: List of relevant regulations
+            session_id: Optional session key whose thread should be reused
+            
+        Returns:
+            Analysis results, including the thread and run IDs
+        """
+        try:
+            thread_id = self._get_thread_id(session_id)
             
             # Add the message to the thread
             self.client.beta.threads.messages.create(
-                thread_id=thread.id,
+                thread_id=thread_id,
                 role="user",
                 content=f"""Please analyze this text for compliance with the following regulations:
-                {', '.join(regulations)}
+                {_format_reg_header(tuple(regulations))}
                 
                 Text to analyze:
                 {text}"""
             )
             
-            # Run the analysis
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
+            # Stream the run so completion is reported as it happens rather than polled
+            with self.client.beta.threads.runs.stream(
+                thread_id=thread_id,
                 assistant_id=self.compliance_assistant.id
-            )
-            
-            # Wait for completion
-            while run.status in ["queued", "in_progress"]:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                time.sleep(1)
-            
-            # Get the response
-            messages = self.client.beta.threads.messages.list(
-                thread_id=thread.id,
-                order="desc"
-            )
+            ) as stream:
+                stream.until_done()
+                run = stream.get_final_run()
+                final_messages = stream.get_final_messages()
             
             # Extract the analysis
-            analysis = messages.data[0].content[0].text.value
+            analysis = final_messages[-1].content[0].text.value
             
             return {
                 "status": "success",
                 "analysis": analysis,
-                "thread_id": thread.id,
+                "thread_id": thread_id,
                 "run_id": run.id
             }
             
@@ -224,6 +464,36 @@ class OpenAIManager:
                 "error": str(e)
             }
     
+    def _get_thread_id(self, session_id: Optional[str]) -> str:
+        """
+        Get the Assistants thread for a session, creating one if needed.
+        
+        Args:
+            session_id: Session key, or None for a one-off thread
+            
+        Returns:
+            str: Thread ID
+        """
+        if session_id is None:
+            return self.client.beta.threads.create().id
+        
+        now = time.monotonic()
+        with self._thread_cache_lock:
+            # Evict sessions that have been idle longer than the TTL
+            expired = [
+                key for key, (_, last_used) in self._thread_cache.items()
+                if now - last_used > THREAD_CACHE_TTL
+            ]
+            for key in expired:
+                del self._thread_cache[key]
+            cached = self._thread_cache.get(session_id)
+        
+        thread_id = cached[0] if cached else self.client.beta.threads.create().id
+        
+        with self._thread_cache_lock:
+            self._thread_cache[session_id] = (thread_id, now)
+        return thread_id
+    
     def _estimate_tokens(self, text: str) -> int:
         """Estimate number of tokens in text"""
         # Rough estimation: 4 chars per token
@@ -238,29 +508,200 @@ class OpenAIManager:
 
 
 class TokenBudget:
-    """Class to manage token usage budget"""
+    """
+    Class to manage token usage budget.
+    
+    When a Redis URL is configured the daily count is kept in Redis, so it is
+    shared by all workers and survives restarts. Otherwise it is tracked in
+    memory for this process only. If Redis errors, the count is tracked in
+    memory for REDIS_RETRY_INTERVAL seconds before Redis is tried again.
+    """
+    
+    # Length of a budget window in seconds
+    RESET_INTERVAL = 24 * 60 * 60
+    
+    # Prefix for the per-day Redis counter keys
+    REDIS_KEY_PREFIX = "openai:token_budget"
     
-    def __init__(self, max_daily_tokens: int = 100000):
+    # Seconds to wait on a Redis connect or command before treating it as failed
+    REDIS_SOCKET_TIMEOUT = 2.0
+    
+    # Seconds to track in memory after a Redis error before trying Redis again
+    REDIS_RETRY_INTERVAL = 30.0
+    
+    def __init__(self, max_daily_tokens: int = 100000, redis_url: Optional[str] = None):
         """
         Initialize token budget tracker.
         
         Args:
             max_daily_tokens: Maximum tokens to use per day
+            redis_url: Optional Redis URL. If not provided, will try to get REDIS_URL from environment
         """
         self.max_daily_tokens = max_daily_tokens
         self.used_tokens = 0
-        self.reset_time = datetime.now() + timedelta(days=1)
+        # Monotonic deadline so wall-clock jumps can't extend or cut short a window
+        self._reset_monotonic = time.monotonic() + self.RESET_INTERVAL
+        # Guards used_tokens so check-then-update is atomic across worker threads
+        self._lock = threading.Lock()
+        
+        self._redis = None
+        # Monotonic time before which Redis is skipped after an error
+        self._redis_retry_at = 0.0
+        # Last daily total Redis reported, where in-memory tracking resumes from
+        self._redis_used = 0
+        redis_url = redis_url or os.getenv('REDIS_URL')
+        if redis_url:
+            if redis is None:
+                logger.warning("REDIS_URL is set but redis is not installed, tracking token budget in memory")
+            else:
+                self._redis = redis.Redis.from_url(
+                    redis_url,
+                    socket_timeout=self.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=self.REDIS_SOCKET_TIMEOUT
+                )
+    
+    def _reset_if_expired(self):
+        """Start a new budget window if the current one has elapsed. Caller must hold the lock."""
+        now = time.monotonic()
+        if now > self._reset_monotonic:
+            self.used_tokens = 0
+            self._reset_monotonic = now + self.RESET_INTERVAL
+    
+    def _redis_key(self) -> Tuple[str, int]:
+        """
+        Get the Redis key for today's counter and the time it should expire.
+        
+        Returns:
+            Tuple[str, int]: (key, UTC midnight timestamp at which the key expires)
+        """
+        today = datetime.now(timezone.utc).date()
+        midnight = datetime.combine(today + timedelta(days=1), dt_time.min, tzinfo=timezone.utc)
+        return f"{self.REDIS_KEY_PREFIX}:{today.isoformat()}", int(midnight.timestamp())
+    
+    def _redis_client(self) -> Any:
+        """
+        Get the Redis client to use for this call.
+        
+        Returns:
+            The client, or None when Redis is not configured or is cooling down after an error
+        """
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        return self._redis
+    
+    def _redis_failed(self, error: Exception):
+        """
+        Track in memory until the retry interval has passed.
+        
+        The client is kept so Redis is used again afterwards. The in-memory count
+        resumes from the last total Redis reported rather than from zero, so an
+        outage does not hand this worker a fresh daily budget.
+        """
+        logger.error(
+            f"Error accessing Redis token budget, tracking in memory for "
+            f"{self.REDIS_RETRY_INTERVAL:.0f}s: {str(error)}"
+        )
+        with self._lock:
+            self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_INTERVAL
+            self._reset_if_expired()
+            self.used_tokens = max(self.used_tokens, self._redis_used)
     
     def can_use_tokens(self, estimated_tokens: int) -> bool:
         """Check if we can use the estimated number of tokens"""
-        if datetime.now() > self.reset_time:
-            self.used_tokens = 0
-            self.reset_time = datetime.now() + timedelta(days=1)
-        return (self.used_tokens + estimated_tokens) <= self.max_daily_tokens
+        client = self._redis_client()
+        if client is not None:
+            key, _ = self._redis_key()
+            try:
+                used = self._redis_used = int(client.get(key) or 0)
+                return (used + estimated_tokens) <= self.max_daily_tokens
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        
+        with self._lock:
+            self._reset_if_expired()
+            return (self.used_tokens + estimated_tokens) <= self.max_daily_tokens
     
     def add_used_tokens(self, tokens: int):
-        """Add used tokens to the count"""
-        self.used_tokens += tokens
+        """Add used tokens to the count; negative values give reserved tokens back"""
+        client = self._redis_client()
+        if client is not None:
+            try:
+                used, key = self._redis_incr(client, tokens)
+                if used < 0:
+                    # Refund landed on a new day's counter; bring it back to zero
+                    client.incrby(key, -used)
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        
+        with self._lock:
+            self._reset_if_expired()
+            # A refund for a reservation made before a reset must not go below zero
+            self.used_tokens = max(0, self.used_tokens + tokens)
+    
+    def _redis_incr(self, client: Any, tokens: int) -> Tuple[int, str]:
+        """
+        Add tokens to today's Redis counter.
+        
+        Returns:
+            Tuple[int, str]: (new total, key of the counter that was updated)
+        """
+        key, expire_at = self._redis_key()
+        pipe = client.pipeline()
+        pipe.incrby(key, tokens)
+        pipe.expireat(key, expire_at)
+        used, _ = pipe.execute()
+        self._redis_used = max(0, used)
+        return used, key
+    
+    def try_acquire(self, tokens: int) -> bool:
+        """
+        Atomically reserve tokens if they fit in the remaining budget.
+        
+        Args:
+            tokens: Number of tokens to reserve
+            
+        Returns:
+            bool: True if the tokens were reserved, False if the budget is exhausted
+        """
+        client = self._redis_client()
+        if client is not None:
+            try:
+                # INCRBY is atomic, so reserve first and give the tokens back on
+                # overshoot, to the same day's counter even if midnight has passed
+                used, key = self._redis_incr(client, tokens)
+                if used > self.max_daily_tokens:
+                    client.decrby(key, tokens)
+                    self._redis_used = used - tokens
+                    return False
+                return True
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        
+        with self._lock:
+            self._reset_if_expired()
+            if self.used_tokens + tokens > self.max_daily_tokens:
+                return False
+            self.used_tokens += tokens
+            return True
+    
+    async def acquire(self, tokens: int) -> bool:
+        """
+        Async variant of try_acquire for coroutine callers.
+        
+        The in-memory critical section never blocks, so it runs inline; Redis
+        round-trips are moved to a worker thread to keep the event loop free.
+        """
+        if self._redis_client() is not None:
+            return await asyncio.to_thread(self.try_acquire, tokens)
+        return self.try_acquire(tokens)
+    
+    async def aadd_used_tokens(self, tokens: int):
+        """Async variant of add_used_tokens, with Redis round-trips in a worker thread."""
+        if self._redis_client() is not None:
+            await asyncio.to_thread(self.add_used_tokens, tokens)
+        else:
+            self.add_used_tokens(tokens)
 
 
 class QuotaExceededError(Exception):
@@ -5,6 +5,8 @@ Example script demonstrating how to use the regulatory search agents.
 import sys
 import os
 import json
+import argparse
+import asyncio
 from typing import List, Dict, Any
 
 # Add the parent directory to the path so we can import the app modules
@@ -12,7 +14,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Try to import the regulatory agents module
 try:
-    from app.models.regulatory_agents import search_with_agents, RegulatorySearchAgent
+    from app.models.regulatory_agents import search_with_agents, asearch_with_agents, RegulatorySearchAgent
     from app.models.public_data import search_regulatory_sources, format_citations
     AGENTS_AVAILABLE = True
 except ImportError:
@@ -41,18 +43,60 @@ def print_results(results: List[Dict[str, Any]], title: str) -> None:
         if "matched_categories" in result and result["matched_categories"]:
             print(f"    Categories: {', '.join(result['matched_categories'])}")
 
+# Example queries
+QUERIES = [
+    "data privacy and GDPR compliance",
+    "financial reporting requirements for public companies",
+    "healthcare data protection and HIPAA",
+    "anti-money laundering regulations",
+    "environmental compliance for manufacturing"
+]
+
+# Maximum number of agent searches in flight at once
+MAX_CONCURRENT_SEARCHES = 5
+
+async def run_all(queries: List[str]) -> List[List[Dict[str, Any]]]:
+    """
+    Run agent-based searches for all queries concurrently.
+    
+    Args:
+        queries: The queries to search for
+        
+    Returns:
+        The search results for each query, in the same order as the queries
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+    
+    async def search_one(query: str) -> List[Dict[str, Any]]:
+        async with semaphore:
+            return await asearch_with_agents(query)
+    
+    return await asyncio.gather(*(search_one(query) for query in queries))
+
+def main_all() -> None:
+    """
+    Run agent-based searches for every example query at once.
+    """
+    print(f"\nPerforming agent-based search for {len(QUERIES)} queries concurrently...")
+    all_results = asyncio.run(run_all(QUERIES))
+    
+    for query, results in zip(QUERIES, all_results):
+        print_results(results, f"Agent-Based Search Results: {query}")
+
 def main() -> None:
     """
     Main function to demonstrate the regulatory search agents.
     """
-    # Example queries
-    queries = [
-        "data privacy and GDPR compliance",
-        "financial reporting requirements for public companies",
-        "healthcare data protection and HIPAA",
-        "anti-money laundering regulations",
-        "environmental compliance for manufacturing"
-    ]
+    parser = argparse.ArgumentParser(description="Regulatory search agents example")
+    parser.add_argument("--all", action="store_true",
+                        help="Run agent-based search for every example query concurrently")
+    args = parser.parse_args()
+    
+    if args.all:
+        main_all()
+        return
+    
+    queries = QUERIES
     
     print("\nRegulatory Search Example")
     print("========================\n")
@@ -1,5 +1,10 @@
 import uvicorn
 import os
+import atexit
+import importlib.util
+import logging
+import logging.handlers
+import queue
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -8,7 +13,48 @@ load_dotenv()
 # Get configuration from environment variables
 host = os.getenv("API_HOST", "0.0.0.0")
 port = int(os.getenv("API_PORT", "8000"))
+is_production = os.getenv("ENVIRONMENT", "development").lower() == "production"
+
+# Faster event loop and HTTP parser when installed (uvicorn[standard])
+loop = "uvloop" if importlib.util.find_spec("uvloop") is not None else "auto"
+http = "httptools" if importlib.util.find_spec("httptools") is not None else "auto"
+
+def setup_logging() -> None:
+    """
+    Route application logs through a queue.
+    
+    Request handlers only enqueue records; a listener thread does the actual
+    writing, so a slow or contended stdout never stalls the request path.
+    """
+    log_queue = queue.SimpleQueue()
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(
+        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    )
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    listener.start()
+    atexit.register(listener.stop)
+
+# Configured at import time so reload/worker subprocesses, which re-import
+# this module, get the same handlers before the app is loaded
+setup_logging()
 
 if __name__ == "__main__":
     print(f"Starting AI Compliance Checker API on {host}:{port}")
-    uvicorn.run("app.main:app", host=host, port=port, reload=True) 
\ No newline at end of file
+    # Auto-reload only in development; production runs one worker per core instead
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)) if is_production else None
+    uvicorn.run(
+        "app.main:app",
+        host=host,
+        port=port,
+        reload=not is_production,
+        workers=workers,
+        loop=loop,
+        http=http
+    )
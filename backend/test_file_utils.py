@@ -1,5 +1,4 @@
 import os
-import io
 import json
 from app.utils.file_utils import detect_file_type, get_file_content
 
@@ -20,7 +19,7 @@ def test_detect_file_type():
         print(f"Text file info: {file_info}")
         
         # Create a test binary file
-        binary_file = create_test_file("test_binary.bin", bytes([0x00, 0x01, 0x02, 0x03, 0xFF, 0xFE, 0xFD, 0xFC]), mode="wb")
+        binary_file = create_test_file("test_binary.bin", b"\x00\x01\x02\x03\xff\xfe\xfd\xfc", mode="wb")
         
         # Detect file type
         file_info = detect_file_type(binary_file)
@@ -68,7 +68,7 @@ def test_detect_file_type():
         assert file_info["encoding"].lower() in ["utf-8", "ascii"]
         
         # Create a test binary file
-        binary_content = bytes([0x00, 0x01, 0x02, 0x03, 0xFF, 0xFE, 0xFD, 0xFC])
+        binary_content = b"\x00\x01\x02\x03\xff\xfe\xfd\xfc"
         binary_filepath = create_test_file("detect_binary.bin", binary_content, mode="wb")
         
         # Detect file type
@@ -1,14 +1,56 @@
 """Pytest configuration for backend tests."""
 
 import os
+import sys
+import pathlib
+
+# Make the backend package importable from every test module, once per session
+sys.path.insert(0, str(pathlib.Path(__file__).parent.parent))
+
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app
 
-@pytest.fixture
+def pytest_addoption(parser):
+    """Register command line options for the backend tests."""
+    parser.addoption(
+        "--run-slow",
+        action="store_true",
+        default=False,
+        help="Run tests marked as slow (e.g. live API calls)",
+    )
+
+def pytest_collection_modifyitems(config, items):
+    """Skip slow tests unless --run-slow is given."""
+    if config.getoption("--run-slow"):
+        return
+    skip_slow = pytest.mark.skip(reason="slow test, use --run-slow to run")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip_slow)
+
+@pytest.fixture(scope="session", autouse=True)
+def storage_dir(tmp_path_factory):
+    """Run the session in a temporary directory so uploads and local_db files stay out of the tree."""
+    # The endpoints write to the relative "uploads" and "local_db" directories
+    path = tmp_path_factory.mktemp("storage")
+    (path / "uploads").mkdir()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(path)
+        yield path
+
+@pytest.fixture(scope="session")
 def client():
-    """Create a test client for the FastAPI application."""
-    return TestClient(app)
+    """Create a test client for the FastAPI application, shared by the whole session."""
+    # Imported here so collecting tests that don't need the app stays cheap
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def gdpr_results():
+    """Regulatory source search results for a GDPR query, computed once per session."""
+    from app.models.public_data import search_regulatory_sources
+    return search_regulatory_sources("data privacy and GDPR compliance")
 
 @pytest.fixture
 def test_data_dir():
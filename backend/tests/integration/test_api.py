@@ -2,41 +2,33 @@ import pytest
 import pytest_asyncio
 from fastapi import FastAPI
 import httpx
-import sys
-import os
 
-# Add the parent directory to the path so we can import the app
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
-
-# Import the app after modifying the path
 from app.main import app
 
-pytestmark = pytest.mark.asyncio
+# Run every test in the session event loop so they can share the client below
+pytestmark = pytest.mark.asyncio(scope="session")
 
 # Create a test client
-@pytest.fixture
+@pytest_asyncio.fixture(scope="session")
 async def client():
-    """Create a test client using HTTPX AsyncClient with ASGITransport."""
+    """Create a test client using HTTPX AsyncClient with ASGITransport, shared by the whole session."""
     transport = httpx.ASGITransport(app=app)
     base_url = "http://testserver"
     async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
         yield client
 
-@pytest.mark.asyncio
 async def test_read_root(client):
     """Test the root endpoint."""
     response = await client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to the AI Compliance Checker API"}
 
-@pytest.mark.asyncio
 async def test_upload_endpoint_no_data(client):
     """Test the upload endpoint with no data."""
     response = await client.post("/api/upload")
     assert response.status_code == 400
-    assert "Either file or text content must be provided" in response.text
+    assert response.json()["detail"] == "Either file or text content must be provided"
 
-@pytest.mark.asyncio
 async def test_upload_endpoint_with_text(client):
     """Test the upload endpoint with text content."""
     response = await client.post(
@@ -44,4 +36,6 @@ async def test_upload_endpoint_with_text(client):
         json={"text_content": "This is a test document for compliance analysis."}
     )
     assert response.status_code == 202
-    assert "Document received and being processed" in response.text 
\ No newline at end of file
+    body = response.json()
+    assert body["message"] == "Document received and being processed"
+    assert "document_id" in body 
\ No newline at end of file
@@ -1,25 +1,22 @@
-from fastapi.testclient import TestClient
-from app.main import app
-
-client = TestClient(app)
-
-def test_read_root():
+def test_read_root(client):
     """Test the root endpoint."""
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to the AI Compliance Checker API"}
 
-def test_upload_endpoint_no_data():
+def test_upload_endpoint_no_data(client):
     """Test the upload endpoint with no data."""
     response = client.post("/api/upload")
     assert response.status_code == 400
-    assert "Either file or text content must be provided" in response.text
+    assert response.json()["detail"] == "Either file or text content must be provided"
 
-def test_upload_endpoint_with_text():
+def test_upload_endpoint_with_text(client):
     """Test the upload endpoint with text content."""
     response = client.post(
         "/api/upload",
         data={"text_content": "This is a test document for compliance analysis."}
     )
     assert response.status_code == 202
-    assert "Document received and being processed" in response.text 
\ No newline at end of file
+    body = response.json()
+    assert body["message"] == "Document received and being processed"
+    assert "document_id" in body 
\ No newline at end of file
@@ -1,127 +1,119 @@
-import os
 import pytest
 import io
 import json
-from fastapi.testclient import TestClient
-from app.main import app
+from pathlib import Path
 from app.utils.file_utils import validate_file, get_file_content, detect_file_type
 
-# Create a test client
-client = TestClient(app)
-
 # Test data directory
-TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+DATA = Path(__file__).parent / "data"
 
-def create_test_file(filename, content, mode="w"):
-    """Helper function to create a test file"""
-    filepath = os.path.join(TEST_DATA_DIR, filename)
-    with open(filepath, mode) as f:
-        f.write(content)
-    return filepath
+@pytest.fixture(scope="session")
+def binary_bytes():
+    """Contents of the checked-in binary fixture, read once per session"""
+    return (DATA / "test_binary.bin").read_bytes()
 
-def test_validate_file_valid_text():
-    """Test validating a valid text file"""
-    from fastapi import UploadFile
-    
-    # Create a mock UploadFile
-    file_content = b"This is a test file"
-    file = UploadFile(
-        filename="test.txt",
-        file=io.BytesIO(file_content)
-    )
-    
-    # Validate the file
-    is_valid, error_message = validate_file(file)
-    
-    assert is_valid is True
-    assert error_message == ""
+@pytest.fixture(scope="session")
+def json_bytes():
+    """Contents of the checked-in JSON fixture, read once per session"""
+    return (DATA / "test.json").read_bytes()
 
-def test_validate_file_invalid_extension():
-    """Test validating a file with invalid extension"""
-    from fastapi import UploadFile
-    
-    # Create a mock UploadFile with invalid extension
-    file_content = b"This is a test file"
-    file = UploadFile(
-        filename="test.exe",
-        file=io.BytesIO(file_content)
-    )
-    
-    # Validate the file
-    is_valid, error_message = validate_file(file)
-    
-    assert is_valid is False
-    assert "File type .exe not allowed" in error_message
+@pytest.fixture(scope="session")
+def binary_file(tmp_path_factory, binary_bytes):
+    """On-disk copy of the binary fixture, written once per session"""
+    filepath = tmp_path_factory.mktemp("bin") / "test_binary.bin"
+    filepath.write_bytes(binary_bytes)
+    return str(filepath)
+
+@pytest.fixture(scope="session")
+def json_file(tmp_path_factory, json_bytes):
+    """On-disk copy of the JSON fixture, written once per session"""
+    filepath = tmp_path_factory.mktemp("json") / "test.json"
+    filepath.write_bytes(json_bytes)
+    return str(filepath)
+
+@pytest.fixture
+def make_file(tmp_path):
+    """Return a helper that writes a test file under pytest's tmp_path"""
+    def _make_file(filename, content, mode="w"):
+        filepath = tmp_path / filename
+        with open(filepath, mode) as f:
+            f.write(content)
+        return str(filepath)
+    return _make_file
 
-def test_validate_file_empty():
-    """Test validating an empty file"""
+@pytest.fixture(scope="module")
+def upload_buffer():
+    """A single in-memory buffer reused by the validate_file cases"""
+    return io.BytesIO()
+
+@pytest.mark.parametrize("filename,content,expected_valid,expected_error", [
+    ("test.txt", b"This is a test file", True, ""),
+    ("test.exe", b"This is a test file", False, "File type .exe not allowed"),
+    ("empty.txt", b"", False, "File is empty"),
+], ids=["valid_text", "invalid_extension", "empty"])
+def test_validate_file(upload_buffer, filename, content, expected_valid, expected_error):
+    """Test validating uploaded files"""
     from fastapi import UploadFile
     
-    # Create a mock empty UploadFile
+    # Refill the shared buffer with this case's content
+    upload_buffer.seek(0)
+    upload_buffer.truncate()
+    upload_buffer.write(content)
+    upload_buffer.seek(0)
+    
+    # Create a mock UploadFile
     file = UploadFile(
-        filename="empty.txt",
-        file=io.BytesIO(b"")
+        filename=filename,
+        file=upload_buffer
     )
     
     # Validate the file
     is_valid, error_message = validate_file(file)
     
-    assert is_valid is False
-    assert "File is empty" in error_message
+    assert is_valid is expected_valid
+    if expected_error:
+        assert expected_error in error_message
+    else:
+        assert error_message == ""
 
-def test_detect_file_type_text():
+def test_detect_file_type_text(make_file):
     """Test detecting a text file type"""
     # Create a test text file
     content = "This is a plain text file for testing."
-    filepath = create_test_file("detect_text.txt", content)
-    
-    try:
-        # Detect file type
-        file_info = detect_file_type(filepath)
-        
-        assert file_info["file_extension"] == ".txt"
-        assert file_info["is_binary"] is False
-        assert file_info["encoding"].lower() in ["utf-8", "ascii"]
-    finally:
-        # Clean up
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
-def test_detect_file_type_binary():
-    """Test detecting a binary file type"""
-    # Use the pre-created binary file
-    filepath = os.path.join(TEST_DATA_DIR, "test_binary.bin")
+    filepath = make_file("detect_text.txt", content)
     
     # Detect file type
     file_info = detect_file_type(filepath)
     
+    assert file_info["file_extension"] == ".txt"
+    assert file_info["is_binary"] is False
+    assert file_info["encoding"].lower() in ["utf-8", "ascii"]
+
+def test_detect_file_type_binary(binary_file):
+    """Test detecting a binary file type"""
+    # Detect file type
+    file_info = detect_file_type(binary_file)
+    
     assert file_info["file_extension"] == ".bin"
-    # The binary detection might vary based on the content, so we don't assert is_binary
+    # The file contains NUL and other control bytes, so the byte scan flags it
+    assert file_info["is_binary"] is True
 
-def test_get_file_content_text():
+def test_get_file_content_text(make_file):
     """Test getting content from a text file"""
     # Create a test text file
     content = "This is a plain text file for testing."
-    filepath = create_test_file("content_text.txt", content)
-    
-    try:
-        # Get file content
-        extracted_content = get_file_content(filepath)
-        
-        assert extracted_content == content
-    finally:
-        # Clean up
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
-def test_get_file_content_json():
-    """Test getting content from a JSON file"""
-    # Use the pre-created JSON file
-    filepath = os.path.join(TEST_DATA_DIR, "test.json")
+    filepath = make_file("content_text.txt", content)
     
     # Get file content
     extracted_content = get_file_content(filepath)
     
+    assert extracted_content == content
+
+def test_get_file_content_json(json_file):
+    """Test getting content from a JSON file"""
+    # Get file content
+    extracted_content = get_file_content(json_file)
+    
     # Parse the extracted content back to JSON
     extracted_data = json.loads(extracted_content)
     
@@ -129,81 +121,69 @@ def test_get_file_content_json():
     assert extracted_data["value"] == 123
     assert extracted_data["nested"]["key"] == "value"
 
-def test_upload_endpoint_with_text():
-    """Test the upload endpoint with text content"""
-    response = client.post(
-        "/api/upload",
-        data={"text_content": "This is a test document for compliance analysis."}
-    )
-    assert response.status_code == 202
-    assert "Document received and being processed" in response.text
-    assert "document_id" in response.json()
+@pytest.mark.parametrize("payload,expected_status,expected_text", [
+    (
+        {"data": {"text_content": "This is a test document for compliance analysis."}},
+        202,
+        "Document received and being processed"
+    ),
+    (
+        {"files": {"file": ("test.txt", b"This is a test document for compliance analysis.", "text/plain")}},
+        202,
+        "Document received and being processed"
+    ),
+    (
+        {"files": {"file": ("test.exe", b"Binary content", "application/octet-stream")}},
+        400,
+        "not allowed"
+    ),
+], ids=["text", "file", "invalid_file"])
+def test_upload_endpoint(client, payload, expected_status, expected_text):
+    """Test the upload endpoint with text content, a valid file and an invalid file"""
+    response = client.post("/api/upload", **payload)
+    
+    assert response.status_code == expected_status
+    body = response.json()
+    if expected_status == 202:
+        assert expected_text in body["message"]
+        assert "document_id" in body
+    else:
+        assert expected_text in body["detail"]
 
-def test_upload_endpoint_with_file():
-    """Test the upload endpoint with a file"""
-    # Create a test file
-    content = "This is a test document for compliance analysis."
-    
-    # Create file data for upload
-    files = {
-        "file": ("test.txt", content.encode(), "text/plain")
-    }
-    
-    response = client.post("/api/upload", files=files)
-    
-    assert response.status_code == 202
-    assert "Document received and being processed" in response.text
-    assert "document_id" in response.json()
-
-def test_upload_endpoint_with_invalid_file():
-    """Test the upload endpoint with an invalid file"""
-    # Create file data for upload with invalid extension
-    files = {
-        "file": ("test.exe", b"Binary content", "application/octet-stream")
-    }
-    
-    response = client.post("/api/upload", files=files)
-    
-    assert response.status_code == 400
-    assert "not allowed" in response.text
-
-def test_batch_upload_endpoint():
-    """Test the batch upload endpoint"""
-    # Create test files
-    files = [
-        ("files", ("test1.txt", b"Test document 1", "text/plain")),
-        ("files", ("test2.txt", b"Test document 2", "text/plain"))
-    ]
-    
-    response = client.post("/api/batch", files=files)
-    
-    assert response.status_code == 202
-    assert "Processed 2 files" in response.text
-    
-    results = response.json()["results"]
-    assert len(results) == 2
-    assert all(result["status"] == "processing" for result in results)
-    assert all("document_id" in result for result in results)
-
-def test_batch_upload_with_mixed_files():
-    """Test the batch upload endpoint with mixed valid and invalid files"""
-    # Create test files - one valid, one invalid
-    files = [
-        ("files", ("test1.txt", b"Test document 1", "text/plain")),
-        ("files", ("test2.exe", b"Invalid file", "application/octet-stream"))
-    ]
+# Batch upload cases: (name, content, MIME type) per file, and the expected status of each result
+BATCH_CASES = [
+    (
+        [("test1.txt", b"Test document 1", "text/plain"),
+         ("test2.txt", b"Test document 2", "text/plain")],
+        ["processing", "processing"]
+    ),
+    (
+        [("test1.txt", b"Test document 1", "text/plain"),
+         ("test2.exe", b"Invalid file", "application/octet-stream")],
+        ["processing", "error"]
+    ),
+]
+
+def assert_batch_result(result, expected_status):
+    """Check one entry of a batch upload response"""
+    assert result["status"] == expected_status
+    if expected_status == "processing":
+        assert "document_id" in result
+    else:
+        assert "not allowed" in result["detail"]
+
+@pytest.mark.parametrize("uploads,expected_statuses", BATCH_CASES, ids=["all_valid", "mixed"])
+def test_batch_upload(client, uploads, expected_statuses):
+    """Test the batch upload endpoint with valid and mixed valid/invalid files"""
+    files = [("files", upload) for upload in uploads]
     
     response = client.post("/api/batch", files=files)
     
     assert response.status_code == 202
+    body = response.json()
+    assert body["message"] == f"Processed {len(uploads)} files"
     
-    results = response.json()["results"]
-    assert len(results) == 2
-    
-    # First file should be processed
-    assert results[0]["status"] == "processing"
-    assert "document_id" in results[0]
-    
-    # Second file should have an error
-    assert results[1]["status"] == "error"
-    assert "not allowed" in results[1]["detail"] 
\ No newline at end of file
+    results = body["results"]
+    assert len(results) == len(expected_statuses)
+    for result, expected_status in zip(results, expected_statuses):
+        assert_batch_result(result, expected_status)
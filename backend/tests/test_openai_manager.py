@@ -3,28 +3,35 @@ Tests for the OpenAI manager module.
 """
 
 import unittest
-from unittest.mock import patch, MagicMock
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
 import os
-from datetime import datetime, timedelta
-from app.utils.openai_manager import OpenAIManager, TokenBudget, QuotaExceededError
+import time
+from datetime import timedelta
+import httpx
+import openai
+import redis
+from freezegun import freeze_time
+from app.utils.openai_manager import OpenAIManager, TokenBudget, QuotaExceededError, _parse_retry_after
 
 class TestOpenAIManager(unittest.TestCase):
     """Test cases for OpenAIManager"""
     
-    def setUp(self):
-        """Set up test environment"""
-        self.api_key = "sk-test123456789"
-        self.manager = OpenAIManager(api_key=self.api_key)
+    @classmethod
+    def setUpClass(cls):
+        """Set up read-only test data shared by all tests"""
+        cls.api_key = "sk-test1234567890123456789012345678901234"
         
         # Sample test data
-        self.test_messages = [
+        cls.test_messages = [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": "Hello!"}
         ]
         
         # Mock OpenAI response
-        self.mock_openai_response = MagicMock(
+        cls.mock_openai_response = MagicMock(
             choices=[
                 MagicMock(
                     message=MagicMock(
@@ -36,6 +43,27 @@ class TestOpenAIManager(unittest.TestCase):
                 total_tokens=50
             )
         )
+        
+        # Rate limit error built once through the real constructor, so the
+        # response the retry logic reads Retry-After from is populated
+        cls.request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        cls.rate_limit_error = openai.RateLimitError(
+            "Rate limit exceeded",
+            response=httpx.Response(429, request=cls.request),
+            body=None
+        )
+    
+    def setUp(self):
+        """Set up test environment"""
+        # Patch the client class where the manager looks it up, so no test talks to the API
+        patcher = patch('app.utils.openai_manager.OpenAI')
+        self.mock_openai = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_client = self.mock_openai.return_value
+        self.mock_client.beta.assistants.create.return_value = MagicMock(id="asst_123")
+        
+        # The manager holds per-test state (token budget, clients, thread cache)
+        self.manager = OpenAIManager(api_key=self.api_key)
 
     def test_validate_api_key(self):
         """Test API key validation"""
@@ -47,13 +75,12 @@ class TestOpenAIManager(unittest.TestCase):
         self.assertFalse(self.manager._validate_api_key("invalid-key"))
         self.assertFalse(self.manager._validate_api_key("sk-short"))
 
-    @patch('openai.OpenAI')
-    def test_call_openai_with_retry(self, mock_openai):
+    @patch('app.utils.openai_manager.time.sleep')
+    def test_call_openai_with_retry(self, mock_sleep):
         """Test OpenAI API call with retry logic"""
         # Setup mock
-        mock_client = MagicMock()
+        mock_client = self.mock_client
         mock_client.chat.completions.create.return_value = self.mock_openai_response
-        mock_openai.return_value = mock_client
         
         # Test successful call
         response = self.manager.call_openai_with_retry(self.test_messages)
@@ -62,11 +89,11 @@ class TestOpenAIManager(unittest.TestCase):
             "Hello! How can I help you today?"
         )
         
-        # Test rate limit handling
-        mock_client.chat.completions.create.side_effect = [
-            openai.RateLimitError("Rate limit exceeded"),
+        # Test rate limit handling: the shared error, then a successful response
+        mock_client.chat.completions.create.side_effect = iter([
+            self.rate_limit_error,
             self.mock_openai_response
-        ]
+        ])
         response = self.manager.call_openai_with_retry(self.test_messages)
         self.assertEqual(
             response.choices[0].message.content,
@@ -74,75 +101,229 @@ class TestOpenAIManager(unittest.TestCase):
         )
         
         # Test quota exceeded
-        mock_client.chat.completions.create.side_effect = openai.APIError("insufficient_quota")
+        mock_client.chat.completions.create.side_effect = openai.APIError(
+            "insufficient_quota", request=self.request, body=None
+        )
         with self.assertRaises(QuotaExceededError):
             self.manager.call_openai_with_retry(self.test_messages)
+        
+        # Two successful calls of 50 tokens each; failed calls gave their reservations back
+        self.assertEqual(self.manager.token_budget.used_tokens, 100)
+    
+    def test_call_openai_reserves_budget(self):
+        """Test that calls reserve their estimate before the request is made"""
+        self.manager.token_budget = TokenBudget(max_daily_tokens=20)
+        
+        def create(**kwargs):
+            # The 16 token estimate is held while the request is in flight
+            self.assertEqual(self.manager.token_budget.used_tokens, 16)
+            return self.mock_openai_response
+        self.mock_client.chat.completions.create.side_effect = create
+        
+        self.manager._call_openai(self.test_messages, 1000, 0.3)
+        # Settled to the 50 tokens the response reports
+        self.assertEqual(self.manager.token_budget.used_tokens, 50)
+        
+        # The budget is now spent, so the next call is refused before any request
+        self.mock_client.chat.completions.create.reset_mock()
+        with self.assertRaises(Exception):
+            self.manager._call_openai(self.test_messages, 1000, 0.3)
+        self.mock_client.chat.completions.create.assert_not_called()
+
+    def test_acall_openai_with_retry(self):
+        """Test async OpenAI API call"""
+        self.manager.aclient = MagicMock()
+        self.manager.aclient.chat.completions.create = AsyncMock(
+            return_value=self.mock_openai_response
+        )
+        
+        response = asyncio.run(self.manager.acall_openai_with_retry(self.test_messages))
+        self.assertEqual(
+            response.choices[0].message.content,
+            "Hello! How can I help you today?"
+        )
+        self.manager.aclient.chat.completions.create.assert_awaited_once()
+        self.assertEqual(self.manager.token_budget.used_tokens, 50)
+    
+    def test_acall_openai_redis_budget_off_loop(self):
+        """Test that the async path makes its Redis budget calls in worker threads"""
+        self.manager.aclient = MagicMock()
+        self.manager.aclient.chat.completions.create = AsyncMock(
+            return_value=self.mock_openai_response
+        )
+        budget = self.manager.token_budget
+        budget._redis = MagicMock()
+        budget._redis.pipeline.return_value.execute.return_value = [16, True]
+        
+        with patch("app.utils.openai_manager.asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+            asyncio.run(self.manager.acall_openai_with_retry(self.test_messages))
+        
+        # Reservation, then settlement of the 34 tokens above the estimate
+        self.assertEqual(
+            [call.args for call in to_thread.call_args_list],
+            [(budget.try_acquire, 16), (budget.add_used_tokens, 34)]
+        )
+        budget._redis.get.assert_not_called()
+
+    def test_parse_retry_after(self):
+        """Test Retry-After header parsing"""
+        error = MagicMock(response=MagicMock(headers={"retry-after": "2"}))
+        self.assertEqual(_parse_retry_after(error), 2.0)
+        
+        error = MagicMock(response=MagicMock(headers={"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}))
+        self.assertEqual(_parse_retry_after(error), 0.0)
+        
+        error = MagicMock(response=MagicMock(headers={}))
+        self.assertIsNone(_parse_retry_after(error))
 
-    def test_token_budget(self):
-        """Test token budget management"""
+    def test_token_budget_reset(self):
+        """Test token budget reset after the daily window"""
+        # Frozen clock (freezegun also fakes time.monotonic) keeps the reset deterministic
+        with freeze_time("2024-01-01") as frozen_time:
+            budget = TokenBudget(max_daily_tokens=1000)
+            budget.add_used_tokens(500)
+            self.assertFalse(budget.can_use_tokens(600))
+            
+            # Test reset
+            frozen_time.tick(timedelta(days=1, seconds=1))
+            self.assertTrue(budget.can_use_tokens(1000))
+
+    def test_token_budget_try_acquire(self):
+        """Test atomic token reservation"""
+        budget = TokenBudget(max_daily_tokens=1000)
+        
+        self.assertTrue(budget.try_acquire(600))
+        self.assertFalse(budget.try_acquire(600))
+        self.assertEqual(budget.used_tokens, 600)
+        
+        # Refunds never take the count below zero
+        budget.add_used_tokens(-1000)
+        self.assertEqual(budget.used_tokens, 0)
+    
+    def test_token_budget_acquire(self):
+        """Test async token reservation"""
         budget = TokenBudget(max_daily_tokens=1000)
         
-        # Test initial state
-        self.assertTrue(budget.can_use_tokens(500))
-        budget.add_used_tokens(500)
+        self.assertTrue(asyncio.run(budget.acquire(600)))
+        self.assertFalse(asyncio.run(budget.acquire(600)))
+        self.assertEqual(budget.used_tokens, 600)
+
+    def test_token_budget_redis(self):
+        """Test token budget backed by Redis"""
+        budget = TokenBudget(max_daily_tokens=1000)
+        budget._redis = MagicMock()
+        budget._redis.get.return_value = b"500"
+        budget._redis.pipeline.return_value.execute.return_value = [1100, True]
         
-        # Test near limit
         self.assertTrue(budget.can_use_tokens(400))
         self.assertFalse(budget.can_use_tokens(600))
         
-        # Test reset
-        budget.reset_time = datetime.now() - timedelta(days=1)
-        self.assertTrue(budget.can_use_tokens(1000))
+        # Over-budget reservations are given back to the counter that took them
+        with patch.object(budget, "_redis_key", side_effect=[
+            ("openai:token_budget:2024-01-01", 0),
+            ("openai:token_budget:2024-01-02", 0),
+        ]):
+            self.assertFalse(budget.try_acquire(600))
+        budget._redis.decrby.assert_called_once_with("openai:token_budget:2024-01-01", 600)
+        self.assertEqual(budget.used_tokens, 0)
 
-    @patch('openai.OpenAI')
-    def test_create_compliance_assistant(self, mock_openai):
+    def test_token_budget_redis_failure(self):
+        """Test in-memory fallback while Redis is failing, and recovery afterwards"""
+        with freeze_time("2024-01-01") as frozen_time:
+            budget = TokenBudget(max_daily_tokens=1000)
+            budget._redis = MagicMock()
+            execute = budget._redis.pipeline.return_value.execute
+            execute.return_value = [800, True]
+            self.assertTrue(budget.try_acquire(100))
+            
+            # Outage: tracked in memory, starting from the last total Redis reported
+            execute.side_effect = redis.ConnectionError("Connection refused")
+            self.assertFalse(budget.try_acquire(300))
+            self.assertTrue(budget.try_acquire(200))
+            self.assertEqual(budget.used_tokens, 1000)
+            
+            # Redis is not retried during the cool-down
+            self.assertFalse(budget.can_use_tokens(1))
+            budget._redis.get.assert_not_called()
+            
+            # Recovery: the shared counter is used again after the retry interval
+            frozen_time.tick(timedelta(seconds=TokenBudget.REDIS_RETRY_INTERVAL + 1))
+            execute.side_effect = None
+            execute.return_value = [900, True]
+            self.assertTrue(budget.try_acquire(100))
+            self.assertEqual(budget.used_tokens, 1000)
+    
+    def test_create_compliance_assistant(self):
         """Test compliance assistant creation"""
-        # Setup mock
-        mock_client = MagicMock()
-        mock_client.beta.assistants.create.return_value = MagicMock(id="asst_123")
-        mock_openai.return_value = mock_client
-        
-        # Create new manager to test assistant creation
-        manager = OpenAIManager(api_key=self.api_key)
-        
-        # Verify assistant was created
-        self.assertIsNotNone(manager.compliance_assistant)
-        mock_client.beta.assistants.create.assert_called_once()
+        # Verify the manager built in setUp created the assistant
+        self.assertEqual(self.manager.compliance_assistant.id, "asst_123")
+        self.mock_client.beta.assistants.create.assert_called_once()
 
-    @patch('openai.OpenAI')
-    def test_analyze_compliance(self, mock_openai):
+    def test_analyze_compliance(self):
         """Test compliance analysis"""
         # Setup mock
-        mock_client = MagicMock()
+        mock_client = self.mock_client
         mock_client.beta.threads.create.return_value = MagicMock(id="thread_123")
-        mock_client.beta.threads.runs.create.return_value = MagicMock(id="run_123")
-        mock_client.beta.threads.runs.retrieve.return_value = MagicMock(status="completed")
-        mock_client.beta.threads.messages.list.return_value = MagicMock(
-            data=[
-                MagicMock(
-                    content=[
-                        MagicMock(
-                            text=MagicMock(
-                                value="Compliance analysis complete. Document is compliant."
-                            )
+        mock_stream = mock_client.beta.threads.runs.stream.return_value.__enter__.return_value
+        mock_stream.get_final_run.return_value = MagicMock(id="run_123", status="completed")
+        mock_stream.get_final_messages.return_value = [
+            MagicMock(
+                content=[
+                    MagicMock(
+                        text=MagicMock(
+                            value="Compliance analysis complete. Document is compliant."
                         )
-                    ]
-                )
-            ]
-        )
-        mock_openai.return_value = mock_client
-        
+                    )
+                ]
+            )
+        ]
+
         # Test analysis
         result = self.manager.analyze_compliance(
             "Sample document text",
-            ["GDPR", "HIPAA"]
+            ["GDPR", "HIPAA"],
+            use_assistants=True
         )
         
         # Verify result
         self.assertEqual(result["status"], "success")
         self.assertIn("analysis", result)
-        self.assertIn("thread_id", result)
-        self.assertIn("run_id", result)
+        self.assertEqual(result["analysis"], "Compliance analysis complete. Document is compliant.")
+        self.assertEqual(result["thread_id"], "thread_123")
+        self.assertEqual(result["run_id"], "run_123")
+        mock_stream.until_done.assert_called_once()
+        mock_client.beta.threads.runs.retrieve.assert_not_called()
+
+    def test_analyze_compliance_reuses_session_thread(self):
+        """Test that an Assistants session keeps its thread between calls"""
+        mock_client = self.mock_client
+        mock_client.beta.threads.create.return_value = MagicMock(id="thread_123")
+        
+        first = self.manager._get_thread_id("doc_1")
+        second = self.manager._get_thread_id("doc_1")
+        
+        self.assertEqual(first, "thread_123")
+        self.assertEqual(second, "thread_123")
+        mock_client.beta.threads.create.assert_called_once()
+        
+        # Expired sessions get a new thread
+        self.manager._thread_cache["doc_1"] = ("thread_123", time.monotonic() - 2 * 60 * 60)
+        self.manager._get_thread_id("doc_1")
+        self.assertEqual(mock_client.beta.threads.create.call_count, 2)
+
+    def test_analyze_compliance_chat(self):
+        """Test compliance analysis with a single chat completion"""
+        with patch.object(self.manager, 'call_openai_with_retry',
+                          return_value=self.mock_openai_response) as mock_call:
+            result = self.manager.analyze_compliance(
+                "Sample document text",
+                ["GDPR", "HIPAA"]
+            )
+        
+        mock_call.assert_called_once()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["analysis"], "Hello! How can I help you today?")
+        self.assertIn("GDPR, HIPAA", mock_call.call_args.kwargs["messages"][1]["content"])
 
     def test_estimate_tokens(self):
         """Test token estimation"""
@@ -150,6 +331,13 @@ class TestOpenAIManager(unittest.TestCase):
         estimated_tokens = self.manager._estimate_tokens(text)
         self.assertEqual(estimated_tokens, 5)  # ~20/4 = 5
 
+    def test_estimate_call_estimates_message_content(self):
+        """Test token estimation for a list of messages"""
+        estimated_tokens, model = self.manager._estimate_call(self.test_messages)
+        # 28 + 6 content chars -> 7 + 1 tokens, plus 4 tokens overhead per message
+        self.assertEqual(estimated_tokens, 16)
+        self.assertEqual(model, "gpt-4")
+
     def test_get_appropriate_model(self):
         """Test model selection based on token count"""
         # Test small text
@@ -164,5 +352,20 @@ class TestOpenAIManager(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.manager._get_appropriate_model(10000)
 
+@pytest.fixture
+def budget():
+    """Fresh token budget for each case"""
+    return TokenBudget(max_daily_tokens=1000)
+
+@pytest.mark.parametrize("used,requested,allowed", [
+    (0, 500, True),
+    (500, 400, True),
+    (500, 600, False),
+], ids=["initial", "near_limit", "over_limit"])
+def test_token_budget(budget, used, requested, allowed):
+    """Test token budget limits"""
+    budget.add_used_tokens(used)
+    assert budget.can_use_tokens(requested) is allowed
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
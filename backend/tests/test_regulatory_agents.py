@@ -2,47 +2,50 @@
 Test script for regulatory agents functionality.
 """
 
-import sys
-import os
+import importlib.util
 import unittest
+import pytest
+from unittest.mock import patch
 from typing import List, Dict, Any
 
-# Add the parent directory to the path so we can import the app modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Check for the regulatory agents module and the packages it imports at
+# module level, without importing them at collection time; tests import lazily
+AGENTS_AVAILABLE = all(
+    importlib.util.find_spec(module) is not None
+    for module in (
+        "app.models.regulatory_agents",
+        "openai",
+        "requests",
+        "duckduckgo_search",
+        "langchain",
+        "langchain_community",
+    )
+)
 
-# Try to import the regulatory agents module
-try:
-    from app.models.regulatory_agents import search_with_agents, RegulatorySearchAgent
-    from app.models.public_data import search_regulatory_sources, format_citations
-    AGENTS_AVAILABLE = True
-except ImportError:
-    AGENTS_AVAILABLE = False
+def test_search_regulatory_sources(gdpr_results):
+    """Test the basic search_regulatory_sources function."""
+    # Results for "data privacy and GDPR compliance", shared across the session
+    results = gdpr_results
+    
+    # Check that we got some results
+    assert len(results) > 0, "Should return at least one result"
+    
+    # Check that the results are sorted by relevance
+    if len(results) > 1:
+        assert results[0]["relevance_score"] >= results[1]["relevance_score"], \
+            "Results should be sorted by relevance score"
+    
+    # Check that the GDPR source is in the results
+    gdpr_found = any("GDPR" in result["source_name"] for result in results)
+    assert gdpr_found, "GDPR should be in the results"
 
 class TestRegulatoryAgents(unittest.TestCase):
     """Test cases for regulatory agents functionality."""
     
-    def test_search_regulatory_sources(self):
-        """Test the basic search_regulatory_sources function."""
-        # Test with a simple query
-        results = search_regulatory_sources("data privacy and GDPR compliance")
-        
-        # Check that we got some results
-        self.assertTrue(len(results) > 0, "Should return at least one result")
-        
-        # Check that the results are sorted by relevance
-        if len(results) > 1:
-            self.assertGreaterEqual(
-                results[0]["relevance_score"], 
-                results[1]["relevance_score"],
-                "Results should be sorted by relevance score"
-            )
-        
-        # Check that the GDPR source is in the results
-        gdpr_found = any("GDPR" in result["source_name"] for result in results)
-        self.assertTrue(gdpr_found, "GDPR should be in the results")
-    
     def test_format_citations(self):
         """Test the format_citations function."""
+        from app.models.public_data import format_citations
+        
         # Create a sample source
         sources = [{
             "source_name": "Test Regulation",
@@ -68,6 +71,8 @@ class TestRegulatoryAgents(unittest.TestCase):
     @unittest.skipIf(not AGENTS_AVAILABLE, "Regulatory agents not available")
     def test_regulatory_search_agent(self):
         """Test the RegulatorySearchAgent class."""
+        from app.models.regulatory_agents import RegulatorySearchAgent
+        
         # Create an agent
         agent = RegulatorySearchAgent()
         
@@ -88,9 +93,30 @@ class TestRegulatoryAgents(unittest.TestCase):
         # Check that we extracted at least one source
         self.assertTrue(len(extracted) > 0, "Should extract at least one source")
     
+    @unittest.skipIf(not AGENTS_AVAILABLE, "Regulatory agents not available")
+    @patch('app.models.regulatory_agents.RegulatorySearchAgent')
+    def test_search_with_agents_mocked(self, mock_agent_class):
+        """Test search_with_agents filtering and sorting without network calls."""
+        from app.models.regulatory_agents import search_with_agents
+        
+        query = "financial reporting requirements for public companies"
+        mock_agent_class.return_value.search.return_value = [
+            {"source_name": "Low", "relevance_score": 0.4},
+            {"source_name": "High", "relevance_score": 0.9},
+            {"source_name": "Below threshold", "relevance_score": 0.1}
+        ]
+        
+        results = search_with_agents(query)
+        
+        mock_agent_class.return_value.search.assert_called_once_with(query)
+        self.assertEqual([r["source_name"] for r in results], ["High", "Low"])
+    
+    @pytest.mark.slow
     @unittest.skipIf(not AGENTS_AVAILABLE, "Regulatory agents not available")
     def test_search_with_agents(self):
         """Test the search_with_agents function."""
+        from app.models.regulatory_agents import search_with_agents
+        
         # This test might take some time as it involves API calls
         results = search_with_agents("financial reporting requirements for public companies")
         
@@ -1,15 +1,36 @@
 import unittest
-import sys
-import os
 import re
+from types import MappingProxyType
 from typing import List, Dict, Any
 
-# Add the parent directory to the path so we can import the app modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from app.models.ai_models import clean_text_for_preview, analyze_document_sections
 from app.models.public_data import format_citations, search_regulatory_sources
 
+# Control characters clean_text_for_preview must strip (tab, newline and carriage return are kept)
+_CONTROL_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+# All 32 C0 control characters, \x00 through \x1f
+_CONTROL_CHARS = bytes(range(32)).decode("latin-1")
+
+# Input longer than the default preview length
+_LONG_TEXT = "A" * 200
+
+# Linearized PDF header as it appears when a PDF is read as text
+_PDF_HEADER = "%PDF-1.6 % 443 0 obj <</Linearized 1/L 225361/O 445/E 130728/N 8/T 224926/H [ 521 358]>> endobj 466"
+
+_XML_CONTENT = "<xml><header>Title</header><body>Content with special chars: &lt;&gt;&amp;</body></xml>"
+
+# Read-only so no test can leak changes into another
+_GDPR_SOURCE = MappingProxyType({
+    "source_name": "General Data Protection Regulation (GDPR)",
+    "source_url": "https://gdpr-info.eu/",
+    "source_description": "Comprehensive data privacy regulation in the EU.",
+    "relevance_score": 0.85,
+    "matched_categories": ["data_privacy", "personal_data"],
+    "organization": "European Union",
+    "publication_date": "2018-05-25"
+})
+
 class TestTextProcessing(unittest.TestCase):
     """Test cases for text processing functions."""
     
@@ -22,26 +43,24 @@ class TestTextProcessing(unittest.TestCase):
     def test_clean_text_for_preview_with_binary_data(self):
         """Test that binary data is properly cleaned."""
         # Create text with binary/non-printable characters
-        binary_text = "Normal text " + "".join(chr(i) for i in range(0, 32)) + " more text"
+        binary_text = "Normal text " + _CONTROL_CHARS + " more text"
         result = clean_text_for_preview(binary_text)
         # Check that result doesn't contain control characters
-        self.assertTrue(all(c.isprintable() or c.isspace() for c in result))
+        self.assertIsNone(_CONTROL_RE.search(result))
         # Check that it contains the readable parts
         self.assertIn("Normal text", result)
         self.assertIn("more text", result)
     
     def test_clean_text_for_preview_with_pdf_header(self):
         """Test that PDF header gibberish is properly cleaned."""
-        pdf_header = "%PDF-1.6 % 443 0 obj <</Linearized 1/L 225361/O 445/E 130728/N 8/T 224926/H [ 521 358]>> endobj 466"
-        result = clean_text_for_preview(pdf_header)
+        result = clean_text_for_preview(_PDF_HEADER)
         # Check that result is readable and preserves meaningful parts
         self.assertNotEqual(result, "[Binary or non-text content]")
         self.assertIn("PDF", result)
     
     def test_clean_text_for_preview_with_xml_content(self):
         """Test that XML content is properly cleaned."""
-        xml_content = "<xml><header>Title</header><body>Content with special chars: &lt;&gt;&amp;</body></xml>"
-        result = clean_text_for_preview(xml_content)
+        result = clean_text_for_preview(_XML_CONTENT)
         # Check that XML structure is preserved
         self.assertIn("<xml>", result)
         self.assertIn("<header>", result)
@@ -49,8 +68,7 @@ class TestTextProcessing(unittest.TestCase):
     
     def test_clean_text_for_preview_with_long_text(self):
         """Test that long text is properly truncated."""
-        long_text = "A" * 200
-        result = clean_text_for_preview(long_text, max_length=100)
+        result = clean_text_for_preview(_LONG_TEXT, max_length=100)
         self.assertEqual(len(result), 103)  # 100 chars + "..."
         self.assertTrue(result.endswith("..."))
     
@@ -68,7 +86,7 @@ class TestTextProcessing(unittest.TestCase):
         """Test that document sections are properly analyzed with mixed content."""
         # Create a document with normal text and some binary-like content
         text = "This is a normal paragraph.\n\n" + \
-               "%PDF-1.6 % 443 0 obj <</Linearized 1/L 225361/O 445/E 130728/N 8/T 224926/H [ 521 358]>> endobj 466\n\n" + \
+               _PDF_HEADER + "\n\n" + \
                "Another normal paragraph with important information."
         
         # Set a small section size to ensure multiple sections
@@ -86,23 +104,11 @@ class TestTextProcessing(unittest.TestCase):
             self.assertIn("confidence", section)
             
             # Check that section_text is readable
-            self.assertTrue(all(c.isprintable() or c.isspace() for c in section["section_text"]))
+            self.assertIsNone(_CONTROL_RE.search(section["section_text"]))
     
     def test_format_citations_with_complete_data(self):
         """Test that citations are properly formatted with complete data."""
-        sources = [
-            {
-                "source_name": "General Data Protection Regulation (GDPR)",
-                "source_url": "https://gdpr-info.eu/",
-                "source_description": "Comprehensive data privacy regulation in the EU.",
-                "relevance_score": 0.85,
-                "matched_categories": ["data_privacy", "personal_data"],
-                "organization": "European Union",
-                "publication_date": "2018-05-25"
-            }
-        ]
-        
-        citations = format_citations(sources)
+        citations = format_citations([_GDPR_SOURCE])
         
         # Check that we have one citation
         self.assertEqual(len(citations), 1)
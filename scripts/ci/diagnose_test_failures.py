@@ -8,10 +8,20 @@ import os
 import re
 import sys
 import json
-import glob
+import mmap
+import fnmatch
+import functools
 import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
+
+# orjson serializes large reports much faster; fall back to json without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Define common failure patterns and their likely causes
 FAILURE_PATTERNS = {
@@ -31,29 +41,114 @@ FAILURE_PATTERNS = {
     r"TimeoutError: (.*)": "Timeout error: {0}",
 }
 
-def find_test_output_files() -> List[Path]:
-    """Find test output files in the current directory and subdirectories."""
-    # Look for pytest output files or other test output files
-    output_files = []
-    for pattern in ["pytest-*.xml", "test-output-*.txt", "test-results-*.xml"]:
-        output_files.extend(glob.glob(f"**/{pattern}", recursive=True))
+# Compiled once at import, in the same order as FAILURE_PATTERNS so the
+# first listed pattern that matches still wins. Each pattern starts with
+# the exception name it reports on
+COMPILED_PATTERNS = [
+    (pattern.split(":", 1)[0], re.compile(pattern), pattern, template)
+    for pattern, template in FAILURE_PATTERNS.items()
+]
+
+# Finds every known exception name in one scan, so only the patterns for
+# exceptions that actually occur are tried
+EXCEPTION_NAME_RE = re.compile(
+    "(" + "|".join(re.escape(name) for name, _, _, _ in COMPILED_PATTERNS) + "): "
+)
+
+# Patterns used to parse plain-text pytest output, matched on the raw bytes
+BLOCK_SEPARATOR_RE = re.compile(rb"={70,}")
+FAILED_TEST_RE = re.compile(rb"FAILED (\w+::\w+::\w+)")
+# The bytes are not newline-translated, so a blank line may be CRLF-terminated
+TRACEBACK_RE = re.compile(rb"Traceback.*?(?=\r?\n\r?\n|\Z)", re.DOTALL)
+
+# Output files larger than this are skipped rather than parsed (1 GB)
+MAX_OUTPUT_FILE_SIZE = 1024 ** 3
+
+# Threads used to read and parse output files concurrently
+MAX_PARSE_WORKERS = 4
+
+# Variable assignments in .env files; comments and blank lines never match
+ENV_VAR_RE = re.compile(rb"(?m)^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_]*)[ \t]*=")
+
+# Names of pytest output files or other test output files
+OUTPUT_FILE_RE = re.compile("|".join(
+    fnmatch.translate(pattern)
+    for pattern in ["pytest-*.xml", "test-output-*.txt", "test-results-*.xml"]
+))
+
+# Dependency, cache and build directories that never hold the project's own
+# test output; hidden directories (.git, .venv, .tox, ...) are skipped as well
+SKIP_DIRS = frozenset({"node_modules", "__pycache__", "venv", "dist", "build"})
+
+def scan_repo(root: str = ".") -> Dict[str, List[Path]]:
+    """Walk the tree once, skipping hidden and SKIP_DIRS directories, and collect test output files, tests directories and .env files."""
+    found = {"output_files": [], "test_dirs": [], "env_files": []}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [
+            name for name in dirnames
+            if not name.startswith(".") and name not in SKIP_DIRS
+        ]
+        for name in dirnames:
+            if name == "tests":
+                found["test_dirs"].append(Path(dirpath, name))
+        for name in filenames:
+            if OUTPUT_FILE_RE.match(name):
+                found["output_files"].append(Path(dirpath, name))
+            elif name.startswith(".env"):
+                found["env_files"].append(Path(dirpath, name))
+    
+    # Sorted so reports do not depend on directory listing order
+    for paths in found.values():
+        paths.sort()
+    
+    return found
+
+def decode_output(data: bytes) -> str:
+    """Decode raw test output, translating newlines as reading in text mode would."""
+    return data.decode("utf-8", "replace").replace("\r\n", "\n").replace("\r", "\n")
+
+def iter_failed_blocks(content) -> Iterator[bytes]:
+    """Yield the blocks between separator lines that mention FAILED, copying only those."""
+    start = 0
+    for separator in BLOCK_SEPARATOR_RE.finditer(content):
+        if content.find(b"FAILED", start, separator.start()) != -1:
+            yield content[start:separator.start()]
+        start = separator.end()
     
-    return [Path(file) for file in output_files]
+    if content.find(b"FAILED", start) != -1:
+        yield content[start:]
 
 def parse_test_output(file_path: Path) -> List[Dict]:
     """Parse test output file and extract failure information."""
     failures = []
     
+    # Skip runaway output files instead of loading them; a file can also be
+    # gone (or a dangling symlink) by the time it is parsed
+    try:
+        file_size = file_path.stat().st_size
+    except OSError as e:
+        print(f"Error reading file {file_path}: {e}")
+        return failures
+    if file_size > MAX_OUTPUT_FILE_SIZE:
+        print(f"Skipping {file_path}: {file_size} bytes exceeds the {MAX_OUTPUT_FILE_SIZE} byte limit")
+        return failures
+    
     # Check file extension to determine parsing method
     if file_path.suffix == ".xml":
         # Parse XML output (e.g., JUnit format)
-        import xml.etree.ElementTree as ET
         try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            
-            # Look for failure elements
-            for test_case in root.findall(".//testcase"):
+            # Stream the file and detach each test case from its parent once
+            # handled, so large reports are never held in memory as a whole tree
+            open_elements = []
+            for event, test_case in ET.iterparse(file_path, events=("start", "end")):
+                if event == "start":
+                    open_elements.append(test_case)
+                    continue
+                open_elements.pop()
+                if test_case.tag != "testcase":
+                    continue
+                
+                # Look for failure elements
                 failure = test_case.find("failure")
                 if failure is not None:
                     failures.append({
@@ -62,24 +157,28 @@ def parse_test_output(file_path: Path) -> List[Dict]:
                         "message": failure.get("message"),
                         "traceback": failure.text
                     })
+                if open_elements:
+                    open_elements[-1].remove(test_case)
         except Exception as e:
             print(f"Error parsing XML file {file_path}: {e}")
     else:
         # Parse text output
         try:
-            with open(file_path, "r") as f:
-                content = f.read()
-                
-            # Look for test failure patterns in text output
-            # This is a simplified example and may need to be adapted for your specific output format
-            test_blocks = re.split(r"={70,}", content)
-            for block in test_blocks:
-                if "FAILED" in block:
-                    test_name_match = re.search(r"FAILED (\w+::\w+::\w+)", block)
-                    test_name = test_name_match.group(1) if test_name_match else "Unknown"
+            # An empty file has no failures (and cannot be memory-mapped)
+            if not file_size:
+                return failures
+            
+            # Map the file rather than reading it into memory; only the parts
+            # that end up in the report are decoded
+            with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                # Look for test failure patterns in text output
+                # This is a simplified example and may need to be adapted for your specific output format
+                for block in iter_failed_blocks(content):
+                    test_name_match = FAILED_TEST_RE.search(block)
+                    test_name = test_name_match.group(1).decode() if test_name_match else "Unknown"
                     
-                    traceback_match = re.search(r"Traceback.*?(?=\n\n|\Z)", block, re.DOTALL)
-                    traceback = traceback_match.group(0) if traceback_match else ""
+                    traceback_match = TRACEBACK_RE.search(block)
+                    traceback = decode_output(traceback_match.group(0)) if traceback_match else ""
                     
                     failures.append({
                         "test_name": test_name,
@@ -94,12 +193,20 @@ def parse_test_output(file_path: Path) -> List[Dict]:
 
 def diagnose_failure(failure: Dict) -> Tuple[str, Optional[str]]:
     """Diagnose the cause of a test failure and suggest a fix."""
-    traceback = failure.get("traceback", "")
-    message = failure.get("message", "")
+    # JUnit XML gives None for a failure without a message attribute or text
+    return diagnose_text(failure.get("traceback") or "", failure.get("message") or "")
+
+@functools.lru_cache(maxsize=1024)
+def diagnose_text(traceback: str, message: str) -> Tuple[str, Optional[str]]:
+    """Diagnose a failure from its traceback and message; cached, since parametrized tests often fail identically."""
+    text = traceback + " " + message
+    present = set(EXCEPTION_NAME_RE.findall(text))
     
     # Check for known failure patterns
-    for pattern, diagnosis_template in FAILURE_PATTERNS.items():
-        match = re.search(pattern, traceback + " " + message)
+    for exception_name, compiled, pattern, diagnosis_template in COMPILED_PATTERNS:
+        if exception_name not in present:
+            continue
+        match = compiled.search(text)
         if match:
             groups = match.groups()
             diagnosis = diagnosis_template.format(*groups)
@@ -145,53 +252,66 @@ def suggest_fix(diagnosis: str, pattern: str, groups: Tuple) -> Optional[str]:
     
     return None
 
-def check_for_common_issues() -> List[Dict]:
+@functools.lru_cache(maxsize=None)
+def get_psycopg2():
+    """Import psycopg2 on first use; returns None if it is not installed, without retrying."""
+    try:
+        import psycopg2
+    except ImportError:
+        return None
+    return psycopg2
+
+def check_for_common_issues(scan: Dict[str, List[Path]]) -> List[Dict]:
     """Check for common issues in the codebase that might cause test failures."""
     issues = []
+    # Snapshot the environment once for every check below
+    env = dict(os.environ)
     
     # Check for missing __init__.py files in test directories
-    test_dirs = glob.glob("**/tests", recursive=True)
-    for test_dir in test_dirs:
-        if not os.path.exists(os.path.join(test_dir, "__init__.py")):
+    for test_dir in scan["test_dirs"]:
+        if not (test_dir / "__init__.py").exists():
             issues.append({
                 "type": "missing_init",
-                "location": test_dir,
+                "location": str(test_dir),
                 "description": "Missing __init__.py in test directory",
                 "fix": f"Create an empty __init__.py file in {test_dir}"
             })
     
     # Check for inconsistent environment variables
-    env_files = glob.glob("**/.env*", recursive=True)
     required_vars = set()
-    for env_file in env_files:
+    for env_file in scan["env_files"]:
         try:
-            with open(env_file, "r") as f:
-                for line in f:
-                    if line.strip() and not line.strip().startswith("#"):
-                        var_name = line.split("=")[0].strip()
-                        required_vars.add(var_name)
+            with open(env_file, "rb") as f:
+                # Interned, as the same names recur across .env files and are
+                # compared against the environment snapshot's keys
+                required_vars.update(
+                    sys.intern(var_name.decode("ascii"))
+                    for var_name in ENV_VAR_RE.findall(f.read())
+                )
         except Exception:
             pass
     
-    for var in required_vars:
-        if var not in os.environ:
-            issues.append({
-                "type": "missing_env_var",
-                "location": "environment",
-                "description": f"Missing environment variable: {var}",
-                "fix": f"Set the {var} environment variable"
-            })
+    for var in sorted(required_vars - env.keys()):
+        issues.append({
+            "type": "missing_env_var",
+            "location": "environment",
+            "description": f"Missing environment variable: {var}",
+            "fix": f"Set the {var} environment variable"
+        })
     
-    # Check for common database connection issues
-    try:
-        import psycopg2
+    # Check for common database connection issues; opt-in with
+    # DIAGNOSE_CHECK_DB=1, since an unreachable host can block for minutes
+    psycopg2 = get_psycopg2() if env.get("DIAGNOSE_CHECK_DB") == "1" else None
+    if psycopg2 is not None:
         try:
             conn = psycopg2.connect(
-                dbname=os.environ.get("POSTGRES_DB", "test_db"),
-                user=os.environ.get("POSTGRES_USER", "postgres"),
-                password=os.environ.get("POSTGRES_PASSWORD", "postgres"),
-                host=os.environ.get("POSTGRES_HOST", "localhost"),
-                port=os.environ.get("POSTGRES_PORT", "5432")
+                dbname=env.get("POSTGRES_DB", "test_db"),
+                user=env.get("POSTGRES_USER", "postgres"),
+                password=env.get("POSTGRES_PASSWORD", "postgres"),
+                host=env.get("POSTGRES_HOST", "localhost"),
+                port=env.get("POSTGRES_PORT", "5432"),
+                connect_timeout=int(env.get("DIAGNOSE_DB_TIMEOUT", "2")),
+                options="-c statement_timeout=1000"
             )
             conn.close()
         except Exception as e:
@@ -201,35 +321,55 @@ def check_for_common_issues() -> List[Dict]:
                 "description": f"Database connection issue: {str(e)}",
                 "fix": "Check database credentials and connection settings"
             })
-    except ImportError:
-        pass
     
     return issues
 
+def dump_json(obj) -> bytes:
+    """Serialize obj as compact JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def write_report(path: str, report: Dict[str, List[Dict]]) -> None:
+    """Write the report as one JSON object, one entry per line, without serializing it all in memory first."""
+    with open(path, "wb") as f:
+        f.write(b"{")
+        for i, (section, entries) in enumerate(report.items()):
+            f.write((b",\n  " if i else b"\n  ") + dump_json(section) + b": [")
+            for j, entry in enumerate(entries):
+                f.write((b",\n    " if j else b"\n    ") + dump_json(entry))
+            f.write(b"\n  ]" if entries else b"]")
+        f.write(b"\n}\n")
+
 def main():
     """Main function to diagnose test failures."""
     print("Diagnosing test failures...")
     
-    # Find test output files
-    output_files = find_test_output_files()
+    # Find test output files, and the files the common issue checks need
+    scan = scan_repo()
+    output_files = scan["output_files"]
     if not output_files:
         print("No test output files found.")
         
         # Check if we can run pytest to generate output
         try:
+            # Only whether pytest runs matters, so its output is discarded
             subprocess.run(
                 ["pytest", "--collect-only"],
                 cwd="backend",
                 check=False,
-                capture_output=True,
-                text=True
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30
             )
             print("Pytest is available. You can run tests to generate output files.")
         except FileNotFoundError:
             print("Pytest not found. Make sure it's installed.")
+        except subprocess.TimeoutExpired:
+            print("Pytest test collection timed out after 30 seconds.")
         
         # Check for common issues anyway
-        issues = check_for_common_issues()
+        issues = check_for_common_issues(scan)
         if issues:
             print("\nFound potential issues:")
             for issue in issues:
@@ -238,18 +378,21 @@ def main():
         
         return
     
-    # Parse test output files and diagnose failures
+    # Parse test output files and diagnose failures; files are parsed in
+    # parallel to overlap their I/O, and results are kept in file order
     all_failures = []
     for file_path in output_files:
         print(f"Analyzing {file_path}...")
-        failures = parse_test_output(file_path)
-        all_failures.extend(failures)
+    with ThreadPoolExecutor(max_workers=min(MAX_PARSE_WORKERS, len(output_files))) as executor:
+        for failures in executor.map(parse_test_output, output_files):
+            all_failures.extend(failures)
     
     if not all_failures:
         print("No test failures found in output files.")
         return
     
-    # Diagnose each failure
+    # Diagnose each failure once; the results are reused for the report
+    diagnoses = []
     print(f"\nFound {len(all_failures)} test failures:")
     for i, failure in enumerate(all_failures, 1):
         test_name = failure.get("test_name", "Unknown test")
@@ -258,6 +401,7 @@ def main():
         print(f"\n{i}. Test: {test_name} ({test_class})")
         
         diagnosis, fix = diagnose_failure(failure)
+        diagnoses.append({"test": failure.get("test_name"), "diagnosis": diagnosis, "fix": fix})
         print(f"   Diagnosis: {diagnosis}")
         
         if fix:
@@ -266,7 +410,7 @@ def main():
             print("   No automatic fix available. Manual investigation required.")
     
     # Check for common issues
-    issues = check_for_common_issues()
+    issues = check_for_common_issues(scan)
     if issues:
         print("\nAdditional potential issues:")
         for issue in issues:
@@ -276,12 +420,11 @@ def main():
     # Write diagnostic report to file
     report = {
         "failures": all_failures,
-        "diagnoses": [{"test": f.get("test_name"), "diagnosis": diagnose_failure(f)[0], "fix": diagnose_failure(f)[1]} for f in all_failures],
+        "diagnoses": diagnoses,
         "issues": issues
     }
     
-    with open("test_diagnosis_report.json", "w") as f:
-        json.dump(report, f, indent=2)
+    write_report("test_diagnosis_report.json", report)
     
     print("\nDiagnostic report written to test_diagnosis_report.json")
 